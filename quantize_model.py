@@ -0,0 +1,75 @@
+import os
+import sys
+import logging
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# rembg caches downloaded models here; run single.py or multi.py once
+# first so the source model exists
+U2NET_HOME = os.path.expanduser(os.environ.get("U2NET_HOME", "~/.u2net"))
+MODEL_NAME = os.environ.get("REMBG_MODEL", "u2net")
+
+
+def quantize_int8(source_path, output_path):
+    """
+    Dynamically quantize the model's Conv/MatMul weights to int8.
+
+    Roughly doubles CPU inference throughput by halving memory
+    bandwidth; mask quality loss is typically under 1% IoU but should
+    be spot-checked on a sample before relying on it.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(
+        source_path,
+        output_path,
+        weight_type=QuantType.QInt8,
+        op_types_to_quantize=["Conv", "MatMul"],
+    )
+    logger.info(f"✓ int8 model written to: {output_path}")
+
+
+def convert_fp16(source_path, output_path):
+    """
+    Convert the model weights to FP16 for GPU inference.
+
+    Halves VRAM and memory bandwidth on the CUDA provider; not useful
+    on CPU, where ONNX Runtime falls back to FP32 emulation.
+    """
+    import onnx
+    from onnxconverter_common import float16
+
+    model = onnx.load(source_path)
+    model_fp16 = float16.convert_float_to_float16(model)
+    onnx.save(model_fp16, output_path)
+    logger.info(f"✓ fp16 model written to: {output_path}")
+
+
+if __name__ == "__main__":
+    # Usage: python quantize_model.py [int8|fp16]  (default: int8)
+    mode = sys.argv[1] if len(sys.argv) > 1 else "int8"
+    source_path = os.path.join(U2NET_HOME, f"{MODEL_NAME}.onnx")
+
+    if not os.path.exists(source_path):
+        print(f"✗ Model not found: {source_path}")
+        print("Run single.py or multi.py once so rembg downloads it first.")
+        sys.exit(1)
+
+    output_path = os.path.join(U2NET_HOME, f"{MODEL_NAME}-{mode}.onnx")
+
+    if mode == "fp16":
+        convert_fp16(source_path, output_path)
+    elif mode == "int8":
+        quantize_int8(source_path, output_path)
+    else:
+        print(f"✗ Unknown mode: {mode} (expected 'int8' or 'fp16')")
+        sys.exit(1)
+
+    print(f"\n✓ Quantized model ready: {output_path}")
+    print(f"Use it via: REMBG_MODEL_PATH={output_path} python multi.py")
+    sys.exit(0)
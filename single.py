@@ -1,5 +1,6 @@
-from rembg import remove
+from rembg import remove, new_session
 from PIL import Image
+import numpy as np
 import io
 import os
 import sys
@@ -8,6 +9,11 @@ from pathlib import Path
 from datetime import datetime
 import json
 
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; concurrent runs are rare there
+    fcntl = None
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -15,8 +21,118 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Inputs are trusted local files; skip PIL's decompression-bomb check
+# (and its warning path) for very large images
+Image.MAX_IMAGE_PIXELS = None
+
+# Model used by rembg; override with e.g. REMBG_MODEL=u2netp. When
+# onnxruntime-gpu is installed the session defaults to the
+# CUDAExecutionProvider, otherwise it runs on CPU.
+DEFAULT_MODEL = os.environ.get("REMBG_MODEL", "u2net")
+
+# Optional: path to a custom .onnx file, e.g. an int8/fp16 model
+# produced by quantize_model.py, loaded via rembg's u2net_custom session
+MODEL_PATH = os.environ.get("REMBG_MODEL_PATH")
+
+# Optional: libjpeg-turbo for 2-3x faster JPEG decode than PIL's default
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _turbo_jpeg = TurboJPEG()
+except Exception:
+    _turbo_jpeg = None
+
+_session = None
+
+
+# PIL transpose operations keyed by EXIF orientation tag (1 = upright)
+_EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def _jpeg_orientation(data):
+    """Read the EXIF orientation tag (1-8, 1 = upright) from raw JPEG
+    bytes. Image.open on a BytesIO only parses headers, so this adds no
+    second decode."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return img.getexif().get(0x0112, 1)
+    except Exception:
+        return 1
+
+
+def _open_image(input_path):
+    """Decode an image from disk. JPEGs go through libjpeg-turbo when
+    PyTurboJPEG is installed; everything else falls back to PIL."""
+    if _turbo_jpeg is not None and input_path.lower().endswith(('.jpg', '.jpeg')):
+        with open(input_path, 'rb') as f:
+            data = f.read()
+        img = Image.fromarray(_turbo_jpeg.decode(data, pixel_format=TJPF_RGB))
+        # fromarray strips the EXIF remove() would otherwise use to fix
+        # the orientation, so re-apply it here; output must not depend
+        # on whether PyTurboJPEG happens to be installed
+        method = _EXIF_TRANSPOSE.get(_jpeg_orientation(data))
+        if method is not None:
+            img = img.transpose(method)
+        return img
+    # Force the lazy decode immediately so corrupt files fail here (not
+    # inside remove()) and the file handle is released right away
+    img = Image.open(input_path)
+    img.load()
+    return img
+
+
+def _flatten_on_white(rgba_image):
+    """Composite an RGBA image over a white background with vectorized
+    NumPy math instead of PIL's per-band split()/paste()."""
+    rgba = np.asarray(rgba_image)
+    alpha = rgba[..., 3:4].astype(np.float32) / 255.0
+    rgb = (rgba[..., :3] * alpha + 255.0 * (1.0 - alpha)).astype(np.uint8)
+    return Image.fromarray(rgb, 'RGB')
+
+
+def _get_session():
+    """Lazily create and cache the rembg session so repeated calls from
+    a long-running process reuse the loaded model."""
+    global _session
+    if _session is None:
+        if MODEL_PATH:
+            _session = new_session("u2net_custom", model_path=MODEL_PATH)
+            logger.info(f"Loaded custom rembg model: {MODEL_PATH}")
+        else:
+            _session = new_session(DEFAULT_MODEL)
+            logger.info(f"Loaded rembg model: {DEFAULT_MODEL}")
+    return _session
+
 
-def remove_background(input_path, output_path=None, quality=95, preserve_format=False):
+def load_processing_log(output_folder="nobdg-images"):
+    """
+    Materialize the aggregated view of the per-run JSONL processing log.
+
+    Returns the same shape the old processing_log.json used, or None if
+    no log exists yet.
+    """
+    log_path = os.path.join(output_folder, "processing_log.jsonl")
+    if not os.path.exists(log_path):
+        return None
+    with open(log_path, 'r') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return {
+        "output_folder": output_folder,
+        "created": entries[0]["timestamp"] if entries else None,
+        "last_updated": entries[-1]["timestamp"] if entries else None,
+        "processed_images": entries
+    }
+
+
+def remove_background(input_path, output_path=None, quality=95, preserve_format=False,
+                      compress_level=1):
     """
     Remove background from a single image with enhanced features.
     Saves all output images to a single 'nobdg-images' folder with '_nobgd' suffix.
@@ -24,8 +140,11 @@ def remove_background(input_path, output_path=None, quality=95, preserve_format=
     Args:
         input_path (str): Path to input image
         output_path (str): Path to save output. Default: input_path_nobgd.png
+            (or .jpg when preserve_format keeps a JPEG input)
         quality (int): Output quality (1-100)
         preserve_format (bool): Keep original format instead of PNG
+        compress_level (int): zlib level for PNG output (0-9). Defaults
+            to 1 to favor encode speed over file size
 
     Returns:
         dict: Result info with success status, paths, and metadata
@@ -40,10 +159,14 @@ def remove_background(input_path, output_path=None, quality=95, preserve_format=
         output_folder = "nobdg-images"
         os.makedirs(output_folder, exist_ok=True)
 
-        # Set default output path with _nobgd suffix
+        # Set default output path with _nobgd suffix; the extension has
+        # to match what the save branch below actually writes
         if output_path is None:
             image_name = Path(input_path).stem
-            output_filename = f"{image_name}_nobgd.png"
+            if preserve_format and input_path.lower().endswith(('.jpg', '.jpeg')):
+                output_filename = f"{image_name}_nobgd.jpg"
+            else:
+                output_filename = f"{image_name}_nobgd.png"
             output_path = os.path.join(output_folder, output_filename)
         else:
             # If custom output path provided, ensure it's in the nobdg-images folder
@@ -52,21 +175,25 @@ def remove_background(input_path, output_path=None, quality=95, preserve_format=
         logger.info(f"Processing: {input_path}")
 
         # Get image metadata
-        input_image = Image.open(input_path)
+        input_image = _open_image(input_path)
         image_size = input_image.size
         logger.info(f"Image loaded: {image_size}")
 
         # Remove background
-        output_image = remove(input_image)
+        output_image = remove(input_image, session=_get_session())
 
         # Save with appropriate settings
         if preserve_format and input_path.lower().endswith(('.jpg', '.jpeg')):
-            # Convert RGBA to RGB for JPG
-            rgb_image = Image.new('RGB', output_image.size, (255, 255, 255))
-            rgb_image.paste(output_image, mask=output_image.split()[3])
-            rgb_image.save(output_path, quality=quality)
+            # Flatten RGBA onto white for JPG (no alpha channel)
+            rgb_image = _flatten_on_white(output_image)
+            # Explicitly empty EXIF/ICC keeps the encode single-pass and
+            # the output deterministic regardless of the source metadata
+            rgb_image.save(output_path, "JPEG", quality=quality, subsampling=2,
+                           optimize=False, progressive=False, exif=b"",
+                           icc_profile=None)
         else:
-            output_image.save(output_path, quality=quality)
+            output_image.save(output_path, format='PNG',
+                              compress_level=compress_level, optimize=False)
 
         logger.info(f"✓ Saved to: {output_path}")
 
@@ -82,25 +209,13 @@ def remove_background(input_path, output_path=None, quality=95, preserve_format=
             "success": True
         }
 
-        metadata_path = os.path.join(output_folder, "processing_log.json")
-        # Load existing log if it exists
-        if os.path.exists(metadata_path):
-            with open(metadata_path, 'r') as f:
-                existing_log = json.load(f)
-            if "processed_images" not in existing_log:
-                existing_log["processed_images"] = []
-            existing_log["processed_images"].append(metadata)
-            existing_log["last_updated"] = metadata["timestamp"]
-        else:
-            existing_log = {
-                "output_folder": output_folder,
-                "created": metadata["timestamp"],
-                "last_updated": metadata["timestamp"],
-                "processed_images": [metadata]
-            }
-
-        with open(metadata_path, 'w') as f:
-            json.dump(existing_log, f, indent=2)
+        # Append one JSONL record per run: O(1) instead of rewriting an
+        # ever-growing JSON file on every invocation
+        metadata_path = os.path.join(output_folder, "processing_log.jsonl")
+        with open(metadata_path, 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.write(json.dumps(metadata) + "\n")
         logger.info(f"Processing log updated: {metadata_path}")
 
         return metadata